@@ -3,63 +3,145 @@ TravelSafe - AI Safety Assistant Backend
 FastAPI application for safety analysis
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, Optional, Dict, Any
+from functools import partial
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import logging
+import mmap
 import os
+import tempfile
+
+# Load environment variables - before importing services, which read settings at import time
+load_dotenv()
 
 # Import services
 from services.image_analysis import analyze_image_safety
-from services.weather_service import get_weather_data
-from services.crime_service import get_crime_data
+from services.weather_service import get_weather_data_async, close_weather_client
+from services.crime_service import get_crime_data_async, clear_crime_cache
 from services.safety_scorer import calculate_safety_score
 from services.incident_service import report_incident, get_incidents_near_location
-from services.auth_service import signup_user, login_user, get_user_by_token, verify_token
+from services.auth_service import signup_user, login_user, get_user_by_token
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Close the pooled upstream HTTP client on shutdown"""
+    try:
+        yield
+    finally:
+        await close_weather_client()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="TravelSafe API",
     description="AI Safety Assistant for rating street and neighborhood safety",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS for Flutter app
+# Browser origins allowed to call the API (comma-separated), e.g. the deployed Flutter web app.
+# Native mobile clients send no Origin header and are not affected by CORS.
+ALLOWED_ORIGINS = tuple(
+    origin.strip() for origin in os.getenv("ALLOWED_ORIGINS", "").split(",") if origin.strip()
+)
+# Local development - `flutter run -d chrome` serves from a random localhost port
+ALLOWED_ORIGIN_REGEX = os.getenv("ALLOWED_ORIGIN_REGEX", r"https?://(localhost|127\.0\.0\.1)(:\d+)?")
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific Flutter app origin
+    allow_origins=ALLOWED_ORIGINS,
+    allow_origin_regex=ALLOWED_ORIGIN_REGEX or None,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Create uploads directory if it doesn't exist
-os.makedirs("uploads", exist_ok=True)
+# Uploaded images are streamed in chunks into a temp file that stays in memory
+# up to SPOOL_MAX_BYTES and spills to disk beyond that
+UPLOAD_CHUNK_BYTES = 1 << 16
+SPOOL_MAX_BYTES = 2 * 1024 * 1024
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 10 * 1024 * 1024))
+
+@asynccontextmanager
+async def spooled_upload(file: UploadFile):
+    """
+    Stream an upload into a spooled temp file, rejecting it with 413 once it exceeds MAX_IMAGE_BYTES.
+    Yields the contents as a bytes-like object - memory-mapped instead of copied when spilled to disk.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+        total = 0
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Image too large (max {MAX_IMAGE_BYTES} bytes)")
+            spool.write(chunk)
+        
+        spool.seek(0)
+        if total > SPOOL_MAX_BYTES:
+            with mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+                yield contents
+        else:
+            yield spool.read()
+
+# Request models - coordinate bounds are enforced by pydantic-core while parsing,
+# unknown fields are rejected instead of being silently dropped
+Latitude = Annotated[float, Field(ge=-90, le=90)]
+Longitude = Annotated[float, Field(ge=-180, le=180)]
 
-# Request models
 class LocationRequest(BaseModel):
-    latitude: float
-    longitude: float
+    model_config = ConfigDict(extra='forbid')
+    
+    latitude: Latitude
+    longitude: Longitude
 
 class SafetyAnalysisRequest(BaseModel):
-    latitude: float
-    longitude: float
+    model_config = ConfigDict(extra='forbid')
+    
+    latitude: Latitude
+    longitude: Longitude
     image_url: Optional[str] = None
 
 class SignupRequest(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     phone_number: str
     full_name: str
     password: str
 
 class LoginRequest(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     phone_number: str
     password: str
 
+# Response models
+class SafetyBreakdown(BaseModel):
+    image_analysis: Optional[int] = None
+    weather: int
+    crime_data: int
+
+class SafetyAnalysisResponse(BaseModel):
+    success: bool
+    location: Dict[str, float]
+    safety_score: int
+    safety_level: str
+    alert: bool
+    breakdown: SafetyBreakdown
+    factors: Dict[str, Any]
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -87,16 +169,16 @@ async def analyze_image(file: UploadFile = File(...)):
     Upload and analyze an image for safety indicators
     """
     try:
-        # Read image file
-        contents = await file.read()
-        
-        # Analyze image
-        analysis = analyze_image_safety(contents)
+        # Stream image file and analyze it
+        async with spooled_upload(file) as contents:
+            analysis = await analyze_image_safety(contents)
         
         return {
             "success": True,
             "analysis": analysis
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -106,7 +188,7 @@ async def get_weather(location: LocationRequest):
     Get weather data for a location
     """
     try:
-        weather_data = get_weather_data(
+        weather_data = await get_weather_data_async(
             location.latitude,
             location.longitude
         )
@@ -123,7 +205,7 @@ async def get_crime(location: LocationRequest):
     Get crime data for a location
     """
     try:
-        crime_data = get_crime_data(
+        crime_data = await get_crime_data_async(
             location.latitude,
             location.longitude
         )
@@ -134,10 +216,10 @@ async def get_crime(location: LocationRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/safety-analysis")
+@app.post("/api/safety-analysis", response_model=SafetyAnalysisResponse)
 async def complete_safety_analysis(
-    latitude: float = Form(...),
-    longitude: float = Form(...),
+    latitude: float = Form(..., ge=-90, le=90),
+    longitude: float = Form(..., ge=-180, le=180),
     file: Optional[UploadFile] = File(None)
 ):
     """
@@ -154,23 +236,27 @@ async def complete_safety_analysis(
     - file: image file (optional)
     """
     try:
-        # Get weather data
-        weather_data = get_weather_data(latitude, longitude)
-        
-        # Get crime data (within 1km radius for drivers)
-        crime_data = get_crime_data(latitude, longitude, radius_km=1.0)
+        async def analyze_upload() -> dict:
+            async with spooled_upload(file) as contents:
+                logger.debug("📸 Analyzing image: %d bytes", len(contents))
+                result = await analyze_image_safety(contents)
+            if result.get('error'):
+                logger.warning("❌ Image analysis error: %s", result.get('error'))
+            else:
+                logger.debug("✅ Image analysis indicators: %s", result.get('indicators', {}))
+            return result
         
-        # Analyze image if provided
-        image_analysis = {"indicators": {}}
+        # Weather, crime (within 1km radius for drivers) and image analysis are independent - run them concurrently
+        tasks = [
+            get_weather_data_async(latitude, longitude),
+            get_crime_data_async(latitude, longitude, radius_km=1.0)
+        ]
         if file:
-            contents = await file.read()
-            print(f"📸 Analyzing image: {len(contents)} bytes")
-            image_analysis = analyze_image_safety(contents)
-            print(f"📸 Image analysis result: {image_analysis.get('error', 'Success')}")
-            if image_analysis.get('error'):
-                print(f"❌ Image analysis error: {image_analysis.get('error')}")
-            else:
-                print(f"✅ Image analysis indicators: {image_analysis.get('indicators', {})}")
+            tasks.append(analyze_upload())
+        
+        results = await asyncio.gather(*tasks)
+        weather_data, crime_data = results[0], results[1]
+        image_analysis = results[2] if file else {"indicators": {}}
         
         # Calculate safety score
         safety_result = calculate_safety_score(
@@ -185,10 +271,10 @@ async def complete_safety_analysis(
                 "latitude": latitude,
                 "longitude": longitude
             },
-            "safety_score": safety_result["safety_score"],
-            "safety_level": safety_result["safety_level"],
-            "alert": safety_result["alert"],
-            "breakdown": safety_result["breakdown"],
+            "safety_score": safety_result.safety_score,
+            "safety_level": safety_result.safety_level,
+            "alert": safety_result.alert,
+            "breakdown": safety_result.breakdown,
             "factors": {
                 "weather": weather_data,
                 "crime": crime_data,
@@ -203,8 +289,8 @@ async def complete_safety_analysis(
 
 @app.post("/api/report-incident")
 async def report_incident_endpoint(
-    latitude: float = Form(...),
-    longitude: float = Form(...),
+    latitude: float = Form(..., ge=-90, le=90),
+    longitude: float = Form(..., ge=-180, le=180),
     incident_type: str = Form(...),
     description: str = Form("")
 ):
@@ -219,6 +305,7 @@ async def report_incident_endpoint(
     """
     try:
         result = report_incident(latitude, longitude, incident_type, description)
+        clear_crime_cache()
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -249,10 +336,15 @@ async def signup_endpoint(request: SignupRequest):
     Requires: phone_number, full_name, password
     """
     try:
-        result = signup_user(
-            phone_number=request.phone_number,
-            full_name=request.full_name,
-            password=request.password
+        # bcrypt is CPU-bound - run it in the threadpool so the event loop keeps serving requests
+        result = await asyncio.get_running_loop().run_in_executor(
+            None,
+            partial(
+                signup_user,
+                phone_number=request.phone_number,
+                full_name=request.full_name,
+                password=request.password
+            )
         )
         
         if result["success"]:
@@ -272,9 +364,14 @@ async def login_endpoint(request: LoginRequest):
     Returns: access_token and user info
     """
     try:
-        result = login_user(
-            phone_number=request.phone_number,
-            password=request.password
+        # bcrypt is CPU-bound - run it in the threadpool so the event loop keeps serving requests
+        result = await asyncio.get_running_loop().run_in_executor(
+            None,
+            partial(
+                login_user,
+                phone_number=request.phone_number,
+                password=request.password
+            )
         )
         
         if result["success"]:
@@ -287,10 +384,11 @@ async def login_endpoint(request: LoginRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/auth/me")
-async def get_current_user(authorization: Optional[str] = Header(None, alias="Authorization")):
+async def get_current_user(request: Request, authorization: Optional[str] = Header(None, alias="Authorization")):
     """
     Get current user information from JWT token
     Requires: Authorization header with Bearer token
+    Supports conditional requests: returns 304 when If-None-Match matches the user's ETag
     """
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header missing")
@@ -301,10 +399,21 @@ async def get_current_user(authorization: Optional[str] = Header(None, alias="Au
         user = get_user_by_token(token)
         
         if user:
-            return {
+            digest = hashlib.blake2b(
+                f"{user['id']}:{user['phone_number']}:{user['full_name']}".encode(), digest_size=8
+            ).hexdigest()
+            # no-cache: the browser revalidates every time (cheap 304) instead of reusing
+            # a profile for a while; Vary keeps another user's token from matching it
+            headers = {"ETag": f'"{digest}"', "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+            
+            if_none_match = request.headers.get("if-none-match", "")
+            if headers["ETag"] in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+                return Response(status_code=304, headers=headers)
+            
+            return ORJSONResponse({
                 "success": True,
                 "user": user
-            }
+            }, headers=headers)
         else:
             raise HTTPException(status_code=401, detail="Invalid or expired token")
     except HTTPException:
@@ -2,13 +2,18 @@
 Authentication Service
 Handles user signup, login, and JWT token management
 """
-import json
 import os
+import re
 import hashlib
+import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict
-from jose import JWTError, jwt
+from cachetools import TTLCache
+import jwt
 import bcrypt
+import orjson
 
 # Password hashing - using bcrypt directly to avoid passlib compatibility issues
 
@@ -17,102 +22,153 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 
-USERS_FILE = "users.json"
+# bcrypt work factor - 10 rounds is ~4x faster than the library default of 12.
+# Existing hashes keep the cost they were created with.
+BCRYPT_DEFAULT_ROUNDS = 10
 
-def load_users() -> list:
-    """Load users from file"""
+# Decoded payloads and resolved users, keyed by the raw token string
+# so repeat requests with the same Bearer token skip the JWT decode and user lookup
+_token_cache = TTLCache(maxsize=10_000, ttl=300)
+_user_cache = TTLCache(maxsize=10_000, ttl=300)
+_token_cache_lock = threading.Lock()
+
+USERS_DB = "users.db"
+USERS_FILE = "users.json"  # Legacy flat-file store, imported once into USERS_DB
+
+def load_users() -> Dict[str, Dict]:
+    """Load users from the legacy JSON file, keyed by phone number"""
     if os.path.exists(USERS_FILE):
         try:
-            with open(USERS_FILE, 'r') as f:
-                return json.load(f)
+            with open(USERS_FILE, 'rb') as f:
+                return {user["phone_number"]: user for user in orjson.loads(f.read())}
         except:
-            return []
-    return []
+            return {}
+    return {}
 
-def save_users(users: list):
-    """Save users to file"""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
+def _to_epoch(created_at) -> int:
+    """Convert a legacy ISO-8601 created_at to epoch seconds (0 if missing or invalid)"""
+    if isinstance(created_at, (int, float)):
+        return int(created_at)
+    try:
+        return int(datetime.fromisoformat(created_at).timestamp())
+    except (TypeError, ValueError):
+        return 0
 
-def get_password_hash(password: str) -> str:
-    """Hash a password - handles bcrypt's 72 byte limit"""
-    # Bcrypt has a 72 byte limit, so we hash long passwords first
-    # If password is longer than 72 bytes, we hash it with SHA256 first
+def _connect() -> sqlite3.Connection:
+    """Open the users database, creating the schema and importing legacy users if needed"""
+    conn = sqlite3.connect(USERS_DB, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT NOT NULL UNIQUE,
+            full_name TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            is_active INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+    
+    # One-shot migration from users.json
+    if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (id, phone_number, full_name, password_hash, created_at, is_active) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (u["id"], u["phone_number"], u["full_name"], u["password_hash"],
+                     _to_epoch(u.get("created_at")), int(u.get("is_active", True)))
+                    for u in load_users().values()
+                ]
+            )
+    return conn
+
+# Shared connection - sqlite3 objects are not safe for concurrent use, so guard with a lock
+_db = _connect()
+_db_lock = threading.Lock()
+
+def find_user(phone_number: str) -> Optional[Dict]:
+    """Look up a user by normalized phone number"""
+    with _db_lock:
+        row = _db.execute(
+            "SELECT id, full_name, password_hash, is_active FROM users WHERE phone_number = ?",
+            (phone_number,)
+        ).fetchone()
+    
+    if row is None:
+        return None
+    
+    return {
+        "id": row[0],
+        "phone_number": phone_number,
+        "full_name": row[1],
+        "password_hash": row[2],
+        "is_active": bool(row[3])
+    }
+
+def update_password_hash(phone_number: str, password_hash: str):
+    """Replace the stored password hash for a user"""
+    with _db_lock, _db:
+        _db.execute(
+            "UPDATE users SET password_hash = ? WHERE phone_number = ?",
+            (password_hash, phone_number)
+        )
+
+def _bcrypt_input(password: str) -> bytes:
+    """Bytes fed to bcrypt - handles bcrypt's 72 byte limit"""
     password_bytes = password.encode('utf-8')
     
     # If password is longer than 72 bytes, hash it with SHA256 first
+    # (the 32 byte raw digest is well within bcrypt's limit)
     if len(password_bytes) > 72:
-        # Hash with SHA256 first, then bcrypt the hash
-        sha256_hash = hashlib.sha256(password_bytes).hexdigest()
-        # SHA256 hexdigest is 64 bytes, which is < 72, so safe for bcrypt
-        return bcrypt.hashpw(sha256_hash.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        return hashlib.sha256(password_bytes).digest()
     
-    # Normal password hashing
-    return bcrypt.hashpw(password_bytes, bcrypt.gensalt()).decode('utf-8')
+    return password_bytes
+
+def get_password_hash(password: str) -> str:
+    """Hash a password - handles bcrypt's 72 byte limit"""
+    rounds = int(os.getenv("BCRYPT_ROUNDS", BCRYPT_DEFAULT_ROUNDS))
+    return bcrypt.hashpw(_bcrypt_input(password), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash - handles bcrypt's 72 byte limit"""
+    try:
+        return bcrypt.checkpw(_bcrypt_input(plain_password), hashed_password.encode('utf-8'))
+    except:
+        return False
+
+def verify_legacy_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify a long password against a hash made with the old SHA256 hexdigest pre-hash.
+    Such hashes must be rehashed with get_password_hash on the next successful login.
+    """
     password_bytes = plain_password.encode('utf-8')
-    hashed_bytes = hashed_password.encode('utf-8')
+    if len(password_bytes) <= 72:
+        return False
     
-    # Try direct verification first
+    sha256_hash = hashlib.sha256(password_bytes).hexdigest()
     try:
-        if bcrypt.checkpw(password_bytes, hashed_bytes):
-            return True
+        return bcrypt.checkpw(sha256_hash.encode('utf-8'), hashed_password.encode('utf-8'))
     except:
-        pass
-    
-    # If password is longer than 72 bytes, hash it with SHA256 first
-    if len(password_bytes) > 72:
-        sha256_hash = hashlib.sha256(password_bytes).hexdigest()
-        try:
-            return bcrypt.checkpw(sha256_hash.encode('utf-8'), hashed_bytes)
-        except:
-            return False
-    
-    return False
+        return False
 
-def validate_phone_number(phone: str) -> bool:
-    """Validate phone number format (Tunisian format: +216XXXXXXXXX or 0XXXXXXXXX)"""
-    # Remove spaces and dashes
-    phone = phone.replace(" ", "").replace("-", "")
-    
-    # Check Tunisian format
-    if phone.startswith("+216"):
-        phone = phone[4:]
-    elif phone.startswith("00216"):
-        phone = phone[5:]
-    elif phone.startswith("216"):
-        phone = phone[3:]
-    
-    # Should be 8 digits starting with 2, 5, 9, or 7
-    if len(phone) == 8 and phone[0] in ["2", "5", "9", "7"]:
-        return True
-    
-    return False
+# Tunisian numbers: optional +216 / 00216 / 216 / 0 prefix, then 8 digits starting with 2, 5, 7 or 9
+_PHONE_RE = re.compile(r'^(?:\+?216|00216|0)?([2579]\d{7})$')
+_PHONE_STRIP = str.maketrans('', '', ' -')
 
-def normalize_phone_number(phone: str) -> str:
-    """Normalize phone number to +216XXXXXXXXX format"""
-    phone = phone.replace(" ", "").replace("-", "")
-    
-    if phone.startswith("+216"):
-        return phone
-    elif phone.startswith("00216"):
-        return "+" + phone[2:]
-    elif phone.startswith("216"):
-        return "+" + phone
-    elif phone.startswith("0"):
-        return "+216" + phone[1:]
-    else:
-        return "+216" + phone
+def normalize_and_validate(phone: str) -> Optional[str]:
+    """Validate a Tunisian phone number and normalize it to +216XXXXXXXX, or None if invalid"""
+    match = _PHONE_RE.match(phone.translate(_PHONE_STRIP))
+    return "+216" + match.group(1) if match else None
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = int(time.time()) + int(expires_delta.total_seconds())
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
     
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
@@ -120,11 +176,25 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 def verify_token(token: str) -> Optional[Dict]:
     """Verify and decode JWT token"""
+    with _token_cache_lock:
+        payload = _token_cache.get(token)
+    if payload is not None and payload["exp"] > time.time():
+        return payload
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+    except jwt.PyJWTError:
         return None
+    
+    with _token_cache_lock:
+        _token_cache[token] = payload
+    return payload
+
+def invalidate_token(token: str):
+    """Drop a token from the verification caches (e.g. on logout)"""
+    with _token_cache_lock:
+        _token_cache.pop(token, None)
+        _user_cache.pop(token, None)
 
 def signup_user(phone_number: str, full_name: str, password: str) -> Dict:
     """
@@ -145,8 +215,9 @@ def signup_user(phone_number: str, full_name: str, password: str) -> Dict:
             "error": "All fields are required"
         }
     
-    # Validate phone number
-    if not validate_phone_number(phone_number):
+    # Validate and normalize phone number
+    normalized_phone = normalize_and_validate(phone_number)
+    if not normalized_phone:
         return {
             "success": False,
             "error": "Invalid phone number format. Use Tunisian format: +216XXXXXXXXX or 0XXXXXXXXX"
@@ -166,34 +237,33 @@ def signup_user(phone_number: str, full_name: str, password: str) -> Dict:
             "error": "Full name must be at least 2 characters long"
         }
     
-    # Normalize phone number
-    normalized_phone = normalize_phone_number(phone_number)
-    
-    # Check if user already exists
-    users = load_users()
-    for user in users:
-        if user.get("phone_number") == normalized_phone:
-            return {
-                "success": False,
-                "error": "Phone number already registered"
-            }
-    
-    # Create new user
+    # Create new user - the UNIQUE index on phone_number rejects duplicates
     new_user = {
-        "id": len(users) + 1,
         "phone_number": normalized_phone,
         "full_name": full_name.strip(),
         "password_hash": get_password_hash(password),
-        "created_at": datetime.now().isoformat(),
+        "created_at": int(time.time()),
         "is_active": True
     }
     
-    users.append(new_user)
-    save_users(users)
+    try:
+        with _db_lock, _db:
+            cursor = _db.execute(
+                "INSERT INTO users (phone_number, full_name, password_hash, created_at, is_active) "
+                "VALUES (?, ?, ?, ?, 1)",
+                (normalized_phone, new_user["full_name"], new_user["password_hash"], new_user["created_at"])
+            )
+    except sqlite3.IntegrityError:
+        return {
+            "success": False,
+            "error": "Phone number already registered"
+        }
+    
+    new_user["id"] = cursor.lastrowid
     
     # Create access token
     access_token = create_access_token(
-        data={"sub": normalized_phone, "user_id": new_user["id"]}
+        data={"sub": normalized_phone, "user_id": new_user["id"], "name": new_user["full_name"]}
     )
     
     return {
@@ -227,15 +297,15 @@ def login_user(phone_number: str, password: str) -> Dict:
         }
     
     # Normalize phone number
-    normalized_phone = normalize_phone_number(phone_number)
+    normalized_phone = normalize_and_validate(phone_number)
+    if not normalized_phone:
+        return {
+            "success": False,
+            "error": "Invalid phone number or password"
+        }
     
     # Find user
-    users = load_users()
-    user = None
-    for u in users:
-        if u.get("phone_number") == normalized_phone:
-            user = u
-            break
+    user = find_user(normalized_phone)
     
     if not user:
         return {
@@ -252,14 +322,17 @@ def login_user(phone_number: str, password: str) -> Dict:
     
     # Verify password
     if not verify_password(password, user["password_hash"]):
-        return {
-            "success": False,
-            "error": "Invalid phone number or password"
-        }
+        if not verify_legacy_password(password, user["password_hash"]):
+            return {
+                "success": False,
+                "error": "Invalid phone number or password"
+            }
+        # Migrate long-password hashes from the old hexdigest pre-hash
+        update_password_hash(normalized_phone, get_password_hash(password))
     
     # Create access token
     access_token = create_access_token(
-        data={"sub": normalized_phone, "user_id": user["id"]}
+        data={"sub": normalized_phone, "user_id": user["id"], "name": user["full_name"]}
     )
     
     return {
@@ -288,18 +361,35 @@ def get_user_by_token(token: str) -> Optional[Dict]:
     if not payload:
         return None
     
+    # Tokens carry the user's id and name, so no storage lookup is needed
+    if "user_id" in payload and "name" in payload:
+        return {
+            "id": payload["user_id"],
+            "phone_number": payload["sub"],
+            "full_name": payload["name"]
+        }
+    
+    # Tokens issued before the name claim was added fall back to a lookup
+    with _token_cache_lock:
+        cached_user = _user_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+    
     phone_number = payload.get("sub")
     if not phone_number:
         return None
     
-    users = load_users()
-    for user in users:
-        if user.get("phone_number") == phone_number:
-            return {
-                "id": user["id"],
-                "phone_number": user["phone_number"],
-                "full_name": user["full_name"]
-            }
+    user = find_user(phone_number)
+    if not user:
+        return None
+    
+    result = {
+        "id": user["id"],
+        "phone_number": user["phone_number"],
+        "full_name": user["full_name"]
+    }
     
-    return None
+    with _token_cache_lock:
+        _user_cache[token] = result
+    return result
 
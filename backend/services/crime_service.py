@@ -2,8 +2,21 @@
 Crime Data Service - Get crime statistics from user-reported incidents
 Uses user-generated incident reports instead of external APIs
 """
+import asyncio
+import copy
+import threading
+from cachetools import TTLCache
 from .incident_service import calculate_crime_score_from_incidents
 
+# Results keyed by coordinates rounded to 3 decimals (~110m) - nearby requests share an entry
+_crime_cache = TTLCache(maxsize=50_000, ttl=60)
+_crime_cache_lock = threading.Lock()
+
+def clear_crime_cache():
+    """Drop cached crime statistics (call after a new incident is reported)"""
+    with _crime_cache_lock:
+        _crime_cache.clear()
+
 def get_crime_data(latitude: float, longitude: float, radius_km: float = 1.0) -> dict:
     """
     Get crime data for a location based on user-reported incidents
@@ -16,8 +29,14 @@ def get_crime_data(latitude: float, longitude: float, radius_km: float = 1.0) ->
     Returns:
         dict: Crime statistics based on user reports
     """
+    key = (round(latitude, 3), round(longitude, 3), round(radius_km, 2))
+    with _crime_cache_lock:
+        cached = _crime_cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+    
     try:
-        return calculate_crime_score_from_incidents(latitude, longitude, radius_km)
+        result = calculate_crime_score_from_incidents(latitude, longitude, radius_km)
     except Exception as e:
         return {
             "crime_rate": 20,
@@ -26,4 +45,12 @@ def get_crime_data(latitude: float, longitude: float, radius_km: float = 1.0) ->
             "error": str(e),
             "data_source": "user_reports"
         }
+    
+    with _crime_cache_lock:
+        _crime_cache[key] = result
+    return copy.deepcopy(result)
 
+async def get_crime_data_async(latitude: float, longitude: float, radius_km: float = 1.0) -> dict:
+    """Non-blocking get_crime_data - runs the incident scan in the default threadpool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_crime_data, latitude, longitude, radius_km)
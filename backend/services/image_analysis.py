@@ -2,22 +2,118 @@
 Image Analysis Service using Groq AI with OpenCV fallback
 """
 import os
+import asyncio
 import base64
+import json
+import logging
 import cv2
 import numpy as np
-from groq import Groq
-from PIL import Image
-import io
+from functools import lru_cache
+from groq import AsyncGroq
+
+try:
+    import numba
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Images are downscaled to about this many pixels before OpenCV analysis
+ANALYSIS_MAX_PIXELS = 512 * 512
+
+# Colour classes used by the OpenCV fallback, one bit each
+ORANGE, YELLOW, BLUE = 1, 2, 4
+
+# Inclusive HSV bounds of each class (OpenCV 8-bit HSV: H 0-179, S/V 0-255)
+_LOWER_ORANGE = np.array([10, 100, 100], dtype=np.uint8)   # Construction signs, barriers
+_UPPER_ORANGE = np.array([25, 255, 255], dtype=np.uint8)
+_LOWER_YELLOW = np.array([20, 100, 100], dtype=np.uint8)   # Construction equipment, warning signs
+_UPPER_YELLOW = np.array([30, 255, 255], dtype=np.uint8)
+_LOWER_BLUE = np.array([100, 50, 50], dtype=np.uint8)      # Water, but also sky
+_UPPER_BLUE = np.array([130, 255, 255], dtype=np.uint8)
+
+def _build_hsv_class_lut() -> np.ndarray:
+    """Per-channel lookup table mapping H, S and V values to the classes they allow"""
+    lut = np.zeros((256, 1, 3), np.uint8)
+    for bit, lower, upper in (
+        (ORANGE, _LOWER_ORANGE, _UPPER_ORANGE),
+        (YELLOW, _LOWER_YELLOW, _UPPER_YELLOW),
+        (BLUE, _LOWER_BLUE, _UPPER_BLUE),
+    ):
+        for channel in range(3):
+            lut[lower[channel]:int(upper[channel]) + 1, 0, channel] |= bit
+    return lut
+
+_HSV_CLASS_LUT = _build_hsv_class_lut()
+# Row i holds the (orange, yellow, blue) membership of class bitmask i
+_CLASS_BITS = (np.arange(8)[:, None] >> np.arange(3)) & 1
+
+def _count_hsv_classes_lut(hsv: np.ndarray):
+    """(orange, yellow, blue) pixel counts of an HSV image using OpenCV LUTs"""
+    # Each channel goes through its own LUT and the three class bitmasks are ANDed together
+    class_h, class_s, class_v = cv2.split(cv2.LUT(hsv, _HSV_CLASS_LUT))
+    classes = cv2.bitwise_and(cv2.bitwise_and(class_h, class_s), class_v)
+    return np.bincount(classes.ravel(), minlength=8) @ _CLASS_BITS
+
+if _NUMBA_AVAILABLE:
+    @numba.njit(inline='always')
+    def _within(h, s, v, lower, upper):
+        return lower[0] <= h <= upper[0] and lower[1] <= s <= upper[1] and lower[2] <= v <= upper[2]
+    
+    # Compiled once and cached on disk, so only the first start pays the compile cost.
+    # The module-level bounds arrays are frozen into the compiled code as constants.
+    @numba.njit(numba.types.UniTuple(numba.int64, 3)(numba.uint8[:, :, ::1]), fastmath=True, cache=True, parallel=True)
+    def _count_hsv_classes(hsv):
+        """(orange, yellow, blue) pixel counts of an HSV image in a single scan"""
+        orange = 0
+        yellow = 0
+        blue = 0
+        for y in numba.prange(hsv.shape[0]):
+            for x in range(hsv.shape[1]):
+                h = hsv[y, x, 0]
+                s = hsv[y, x, 1]
+                v = hsv[y, x, 2]
+                orange += _within(h, s, v, _LOWER_ORANGE, _UPPER_ORANGE)
+                yellow += _within(h, s, v, _LOWER_YELLOW, _UPPER_YELLOW)
+                blue += _within(h, s, v, _LOWER_BLUE, _UPPER_BLUE)
+        return orange, yellow, blue
+else:
+    _count_hsv_classes = _count_hsv_classes_lut
+
+# Encoded payload size above which images are decoded at reduced resolution.
+# A 12MP phone photo is typically 3-5 MB and still exceeds ANALYSIS_MAX_PIXELS at 1/4 scale
+REDUCED_DECODE_FLAGS = (
+    (2 * 1024 * 1024, cv2.IMREAD_REDUCED_COLOR_4),
+    (512 * 1024, cv2.IMREAD_REDUCED_COLOR_2),
+)
+# How many times smaller (per side) each decode flag makes the image
+DECODE_REDUCTION = {
+    cv2.IMREAD_REDUCED_COLOR_4: 4,
+    cv2.IMREAD_REDUCED_COLOR_2: 2,
+    cv2.IMREAD_COLOR: 1,
+}
+
+def _decode_flag(payload_size: int) -> int:
+    """Pick the cv2.imdecode flag for an encoded image of the given size"""
+    for min_size, flag in REDUCED_DECODE_FLAGS:
+        if payload_size >= min_size:
+            return flag
+    return cv2.IMREAD_COLOR
 
 def analyze_image_with_opencv(image_bytes: bytes) -> dict:
     """
     Fallback image analysis using OpenCV when Groq vision is unavailable
     Detects basic road hazards using computer vision
+    
+    Accepts any bytes-like object (bytes, memoryview, mmap)
     """
     try:
-        # Convert bytes to numpy array
+        # Convert bytes to numpy array and decode - large JPEGs are decoded straight
+        # at 1/2 or 1/4 scale by the IDCT, so the full-size image is never built
         nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        decode_flag = _decode_flag(len(nparr))
+        img = cv2.imdecode(nparr, decode_flag)
         
         if img is None:
             return {
@@ -25,9 +121,19 @@ def analyze_image_with_opencv(image_bytes: bytes) -> dict:
                 "indicators": {}
             }
         
-        # Convert to different color spaces for analysis
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        # Edges and brightness use the decoded image - fine texture (gravel, debris)
+        # does not survive the fixed-size resize below
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        upload_width = img.shape[1] * DECODE_REDUCTION[decode_flag]
+        
+        # Colour analysis works on a fixed-size copy - its results are percentages,
+        # so extra resolution only costs time
+        height, width = img.shape[:2]
+        if height * width > ANALYSIS_MAX_PIXELS:
+            scale = (ANALYSIS_MAX_PIXELS / (height * width)) ** 0.5
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
         
         road_hazards = {
             "construction_roadwork": False,
@@ -38,36 +144,32 @@ def analyze_image_with_opencv(image_bytes: bytes) -> dict:
         }
         
         hazard_severity = "none"
-        hazard_description = ""
-        
-        # Detect orange/yellow colors (construction signs, barriers)
-        # Orange range in HSV
-        lower_orange = np.array([10, 100, 100])
-        upper_orange = np.array([25, 255, 255])
-        orange_mask = cv2.inRange(hsv, lower_orange, upper_orange)
-        orange_pixels = cv2.countNonZero(orange_mask)
-        orange_percentage = (orange_pixels / (img.shape[0] * img.shape[1])) * 100
-        
-        # Detect yellow colors (construction equipment, warning signs)
-        lower_yellow = np.array([20, 100, 100])
-        upper_yellow = np.array([30, 255, 255])
-        yellow_mask = cv2.inRange(hsv, lower_yellow, upper_yellow)
-        yellow_pixels = cv2.countNonZero(yellow_mask)
-        yellow_percentage = (yellow_pixels / (img.shape[0] * img.shape[1])) * 100
-        
-        # Detect blue colors (water, but also sky - need to be careful)
-        lower_blue = np.array([100, 50, 50])
-        upper_blue = np.array([130, 255, 255])
-        blue_mask = cv2.inRange(hsv, lower_blue, upper_blue)
-        blue_pixels = cv2.countNonZero(blue_mask)
-        blue_percentage = (blue_pixels / (img.shape[0] * img.shape[1])) * 100
+        description_parts = []
+        
+        # Classify orange/yellow/blue pixels in a single pass over HSV, counting the
+        # upper and lower halves separately (row slices are views - nothing is copied)
+        half = hsv.shape[0] // 2
+        upper_orange, upper_yellow, upper_blue = _count_hsv_classes(hsv[:half])
+        lower_orange, lower_yellow, lower_blue = _count_hsv_classes(hsv[half:])
+        orange_pixels = upper_orange + lower_orange
+        yellow_pixels = upper_yellow + lower_yellow
+        blue_pixels = upper_blue + lower_blue
+        
+        total_pixels = img.shape[0] * img.shape[1]
+        orange_percentage = (orange_pixels / total_pixels) * 100  # Construction signs, barriers
+        yellow_percentage = (yellow_pixels / total_pixels) * 100  # Construction equipment, warning signs
+        blue_percentage = (blue_pixels / total_pixels) * 100      # Water, but also sky - need to be careful
+        lower_blue_percentage = (lower_blue / (total_pixels - half * img.shape[1])) * 100
         
         # Detect edges (potential obstacles, road damage)
         edges = cv2.Canny(gray, 50, 150)
-        edge_density = cv2.countNonZero(edges) / (img.shape[0] * img.shape[1])
+        # Edges are thin lines, so their pixel count grows with image width rather than area:
+        # a reduced decode has a proportionally higher density. Scale it back to the uploaded
+        # resolution, which the 0.12/0.15 thresholds below were tuned on.
+        edge_density = cv2.countNonZero(edges) / gray.size * (gray.shape[1] / upload_width)
         
         # Analyze brightness (lighting conditions)
-        mean_brightness = np.mean(gray)
+        mean_brightness = cv2.mean(gray)[0]
         
         # Heuristics for hazard detection
         # Lower threshold for construction detection (orange/yellow = construction signs, barriers, workers)
@@ -77,20 +179,20 @@ def analyze_image_with_opencv(image_bytes: bytes) -> dict:
             # If both orange and yellow are present, it's more likely construction
             if orange_percentage > construction_threshold and yellow_percentage > construction_threshold:
                 hazard_severity = "high"
-                hazard_description += f"Active construction/roadwork detected (orange: {orange_percentage:.1f}%, yellow: {yellow_percentage:.1f}%). "
+                description_parts.append(f"Active construction/roadwork detected (orange: {orange_percentage:.1f}%, yellow: {yellow_percentage:.1f}%). ")
             else:
                 hazard_severity = "moderate"
-                hazard_description += f"Construction/roadwork detected (orange/yellow colors: {orange_percentage + yellow_percentage:.1f}%). "
+                description_parts.append(f"Construction/roadwork detected (orange/yellow colors: {orange_percentage + yellow_percentage:.1f}%). ")
         
         # Water detection - be more careful (blue could be sky)
         # Only detect water if blue is in lower part of image (not sky)
-        if blue_percentage > 20:  # High blue percentage
+        if blue_percentage > 20 and lower_blue_percentage > 20:  # High blue percentage, also near the ground
             # Check if it's likely water (would need image analysis, but for now use edge density)
             if edge_density > 0.12:  # Water has reflections/edges
                 road_hazards["water_flooding"] = True
                 if hazard_severity in ["none", "low"]:
                     hazard_severity = "moderate"
-                hazard_description += f"Possible water/flooding detected (blue: {blue_percentage:.1f}%). "
+                description_parts.append(f"Possible water/flooding detected (blue: {blue_percentage:.1f}%, lower half: {lower_blue_percentage:.1f}%). ")
         
         # High edge density indicates obstacles, debris, or poor road condition
         if edge_density > 0.15:
@@ -99,12 +201,12 @@ def analyze_image_with_opencv(image_bytes: bytes) -> dict:
                 hazard_severity = "low"
             elif hazard_severity == "low" and road_hazards.get("construction_roadwork"):
                 hazard_severity = "moderate"  # Construction + poor road = higher severity
-            hazard_description += f"High edge density detected (possible obstacles or road damage: {edge_density:.3f}). "
+            description_parts.append(f"High edge density detected (possible obstacles or road damage: {edge_density:.3f}). ")
         
         # If construction is detected, also mark as poor road condition
         if road_hazards.get("construction_roadwork") and not road_hazards.get("poor_road_condition"):
             road_hazards["poor_road_condition"] = True
-            hazard_description += "Construction zone typically indicates road work in progress. "
+            description_parts.append("Construction zone typically indicates road work in progress. ")
         
         # Determine lighting
         if mean_brightness > 150:
@@ -117,15 +219,16 @@ def analyze_image_with_opencv(image_bytes: bytes) -> dict:
         # Determine if travel is safe
         travel_safe = hazard_severity in ["none", "low"]
         
+        hazard_description = "".join(description_parts)
         if not hazard_description:
             hazard_description = "No obvious hazards detected by computer vision analysis."
         
-        print(f"🔍 OpenCV Analysis Results:")
-        print(f"  - Orange/Yellow: {orange_percentage:.1f}% (construction)")
-        print(f"  - Blue: {blue_percentage:.1f}% (possible water)")
-        print(f"  - Edge density: {edge_density:.3f}")
-        print(f"  - Brightness: {mean_brightness:.1f}")
-        print(f"  - Hazards detected: {road_hazards}")
+        logger.debug(
+            "🔍 OpenCV analysis: orange/yellow %.1f%%, blue %.1f%% (lower half %.1f%%), "
+            "edge density %.3f, brightness %.1f, hazards %s",
+            orange_percentage, blue_percentage, lower_blue_percentage,
+            edge_density, mean_brightness, road_hazards
+        )
         
         return {
             "analysis": f"OpenCV-based analysis: {hazard_description}",
@@ -143,63 +246,43 @@ def analyze_image_with_opencv(image_bytes: bytes) -> dict:
             "hazard_description": hazard_description
         }
     except Exception as e:
-        print(f"❌ OpenCV analysis error: {str(e)}")
+        logger.warning("❌ OpenCV analysis error: %s", e)
         return {
             "error": f"OpenCV analysis failed: {str(e)}",
             "indicators": {}
         }
 
-def analyze_image_safety(image_bytes: bytes) -> dict:
+@lru_cache(maxsize=1)
+def _get_groq_client(api_key: str) -> AsyncGroq:
     """
-    Analyze image for safety indicators using Groq AI
+    Create the Groq client once and reuse it (and its connection pool) across requests
+    
+    Args:
+        api_key: Groq API key
     
     Returns:
-        dict: Analysis results with safety indicators
+        AsyncGroq: Shared client
     """
-    groq_api_key = os.getenv("GROQ_API_KEY")
-    
-    if not groq_api_key:
-        return {
-            "error": "GROQ_API_KEY not found",
-            "safety_score": 50,
-            "indicators": []
-        }
+    # Workaround for proxies parameter issue - clear proxy env vars while the client is built
+    proxy_vars = {}
+    for var in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'ALL_PROXY', 'all_proxy']:
+        if var in os.environ:
+            proxy_vars[var] = os.environ.pop(var)
     
     try:
-        # Initialize Groq client
-        # Workaround for proxies parameter issue - clear proxy env vars temporarily
-        import os as groq_os
-        
-        # Save and remove proxy env vars that might cause issues
-        proxy_vars = {}
-        for var in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'ALL_PROXY', 'all_proxy']:
-            if var in groq_os.environ:
-                proxy_vars[var] = groq_os.environ.pop(var)
-        
-        try:
-            # Initialize Groq client
-            client = Groq(api_key=groq_api_key)
-        except Exception as init_error:
-            error_str = str(init_error)
-            if "proxies" in error_str.lower():
-                # If still failing, try with requests session without proxies
-                import requests
-                session = requests.Session()
-                session.proxies = {}
-                # This is a workaround - we'll use the client as is
-                # The error might be in the underlying HTTP client
-                raise Exception(f"Groq SDK version issue. Please upgrade: pip install --upgrade groq")
-            raise
-        finally:
-            # Restore proxy env vars if they existed
-            for var, value in proxy_vars.items():
-                groq_os.environ[var] = value
-        
-        # Convert image to base64
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        
-        # Prepare the prompt for safety analysis - focus on travel/road hazards
-        prompt = f"""Analyze this street/road image for TRAVEL SAFETY and ROAD HAZARDS.
+        return AsyncGroq(api_key=api_key)
+    except Exception as init_error:
+        if "proxies" in str(init_error).lower():
+            # The error is in the underlying HTTP client of old SDK versions
+            raise Exception("Groq SDK version issue. Please upgrade: pip install --upgrade groq")
+        raise
+    finally:
+        # Restore proxy env vars if they existed
+        for var, value in proxy_vars.items():
+            os.environ[var] = value
+
+# Safety-analysis prompt sent with every image - focus on travel/road hazards
+_VISION_PROMPT = """Analyze this street/road image for TRAVEL SAFETY and ROAD HAZARDS.
         
         CRITICAL: Look for these specific travel obstacles and hazards:
         1. **Roadwork/Construction (Travaux)**: Barricades, construction signs, workers, heavy machinery, road closures
@@ -215,14 +298,14 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
         - Visible security features (cameras, lights, etc.)
         
         Return a JSON object with:
-        {{
-            "road_hazards": {{
+        {
+            "road_hazards": {
                 "construction_roadwork": true/false,
                 "water_flooding": true/false,
                 "obstacles_debris": true/false,
                 "poor_road_condition": true/false,
                 "traffic_hazards": true/false
-            }},
+            },
             "hazard_severity": "none" | "low" | "moderate" | "high" | "critical",
             "hazard_description": "brief description of hazards found",
             "lighting": "good" | "moderate" | "poor",
@@ -232,27 +315,62 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
             "overall_condition": "good" | "moderate" | "poor",
             "safety_notes": "brief description of safety concerns for travelers",
             "travel_safe": true/false  // Is it safe to travel this route?
-        }}
+        }
         
         IMPORTANT: If you see construction, water, obstacles, or poor road conditions, mark them as true and set hazard_severity accordingly."""
-        
-        # Use Groq's vision API with image
-        # Create message with image
-        user_message = {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": prompt
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{image_base64}"
-                    }
+
+def _image_data_url(image_bytes: bytes) -> str:
+    """Encode an image as a base64 JPEG data URL (built as bytes, decoded as ASCII)"""
+    return (b"data:image/jpeg;base64," + base64.b64encode(image_bytes)).decode('ascii')
+
+def _build_vision_message(image_url: str) -> dict:
+    """Create the chat message carrying the safety-analysis prompt and the image"""
+    return {
+        "role": "user",
+        "content": [
+            {
+                "type": "text",
+                "text": _VISION_PROMPT
+            },
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": image_url
                 }
-            ]
+            }
+        ]
+    }
+
+async def analyze_image_safety(image_bytes: bytes) -> dict:
+    """
+    Analyze image for safety indicators using Groq AI
+    
+    The Groq call is awaited and the OpenCV fallback runs in a worker thread,
+    so neither blocks the event loop.
+    
+    Args:
+        image_bytes: Encoded image as any bytes-like object (bytes, memoryview, mmap)
+    
+    Returns:
+        dict: Analysis results with safety indicators
+    """
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    
+    if not groq_api_key:
+        return {
+            "error": "GROQ_API_KEY not found",
+            "safety_score": 50,
+            "indicators": []
         }
+    
+    try:
+        client = _get_groq_client(groq_api_key)
+        
+        # Convert image to a base64 data URL once - the retry path reuses it
+        image_url = _image_data_url(image_bytes)
+        
+        # Use Groq's vision API with image
+        user_message = _build_vision_message(image_url)
         
         # Try different vision models - Groq vision models
         # Note: Some models may not support vision, so we try multiple approaches
@@ -267,8 +385,8 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
         # First, try with vision-capable models using image_url format
         for model_name in vision_models:
             try:
-                print(f"🔄 Trying vision model: {model_name}")
-                response = client.chat.completions.create(
+                logger.debug("🔄 Trying vision model: %s", model_name)
+                response = await client.chat.completions.create(
                     model=model_name,
                     messages=[
                         {
@@ -279,12 +397,12 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
                     ],
                     response_format={"type": "json_object"}
                 )
-                print(f"✅ Success with vision model: {model_name}")
+                logger.debug("✅ Success with vision model: %s", model_name)
                 break
             except Exception as model_error:
                 last_error = model_error
                 error_str = str(model_error)
-                print(f"❌ Vision model {model_name} failed: {error_str}")
+                logger.warning("❌ Vision model %s failed: %s", model_name, error_str)
                 # If model doesn't exist or is decommissioned, try next
                 if "decommissioned" in error_str.lower() or "not found" in error_str.lower():
                     continue
@@ -295,14 +413,13 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
         
         # If vision models failed, use OpenCV-based analysis as fallback
         if response is None:
-            print("🔄 Vision models not available, using OpenCV-based analysis...")
-            return analyze_image_with_opencv(image_bytes)
+            logger.info("🔄 Vision models not available, using OpenCV-based analysis")
+            return await asyncio.to_thread(analyze_image_with_opencv, image_bytes)
         
         # Parse response
         analysis_text = response.choices[0].message.content
         
         # Parse JSON response
-        import json
         try:
             analysis_data = json.loads(analysis_text)
             
@@ -322,14 +439,10 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
                 "safety_notes": analysis_data.get("safety_notes", "")
             }
             
-            # Debug print
-            print(f"🔍 Image Analysis Results:")
-            print(f"  - Road Hazards: {road_hazards}")
-            print(f"  - Has Construction: {road_hazards.get('construction_roadwork', False)}")
-            print(f"  - Has Water: {road_hazards.get('water_flooding', False)}")
-            print(f"  - Has Obstacles: {road_hazards.get('obstacles_debris', False)}")
-            print(f"  - Hazard Severity: {indicators['hazard_severity']}")
-            print(f"  - Travel Safe: {indicators['travel_safe']}")
+            logger.debug(
+                "🔍 Image analysis: road hazards %s, severity %s, travel safe %s",
+                road_hazards, indicators["hazard_severity"], indicators["travel_safe"]
+            )
             
             return {
                 "analysis": analysis_text,
@@ -354,64 +467,23 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
         
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ Image Analysis Error: {error_msg}")
+        logger.warning("❌ Image analysis error: %s", error_msg)
         
         # If it's a proxies error, try without any proxy settings
         if "proxies" in error_msg.lower():
             try:
                 # Try again with explicit no-proxy settings
-                import os as groq_os
                 for proxy_var in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
-                    groq_os.environ.pop(proxy_var, None)
-                
-                # Retry initialization
-                client = Groq(api_key=groq_api_key)
+                    os.environ.pop(proxy_var, None)
                 
-                # Retry the full analysis - recreate prompt and image
-                image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-                retry_prompt = """Analyze this street/road image for TRAVEL SAFETY and ROAD HAZARDS.
-        
-        CRITICAL: Look for these specific travel obstacles and hazards:
-        1. **Roadwork/Construction (Travaux)**: Barricades, construction signs, workers, heavy machinery, road closures
-        2. **Water/Flooding**: Standing water, flooded areas, puddles, drainage issues
-        3. **Road Obstacles**: Debris, fallen trees, rocks, large potholes, broken pavement
-        4. **Traffic Hazards**: Heavy traffic, dangerous intersections, lack of traffic signs
-        5. **Road Conditions**: Damaged road, cracks, uneven surface, slippery conditions
-        
-        Return a JSON object with:
-        {
-            "road_hazards": {
-                "construction_roadwork": false,
-                "water_flooding": false,
-                "obstacles_debris": false,
-                "poor_road_condition": false,
-                "traffic_hazards": false
-            },
-            "hazard_severity": "none",
-            "hazard_description": "",
-            "lighting": "moderate",
-            "people_present": false,
-            "cleanliness": "moderate",
-            "travel_safe": true
-        }"""
+                # Retry initialization - drop the cached client built with the old settings
+                _get_groq_client.cache_clear()
+                client = _get_groq_client(groq_api_key)
                 
-                user_message = {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": retry_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
-                        }
-                    ]
-                }
+                # Retry the full analysis with the same prompt and image
+                user_message = _build_vision_message(image_url)
                 
-                response = client.chat.completions.create(
+                response = await client.chat.completions.create(
                     model="llama-3.2-90b-vision-preview",
                     messages=[
                         {
@@ -424,7 +496,6 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
                 )
                 
                 analysis_text = response.choices[0].message.content
-                import json
                 analysis_data = json.loads(analysis_text)
                 
                 road_hazards = analysis_data.get("road_hazards", {})
@@ -442,9 +513,10 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
                     "safety_notes": analysis_data.get("safety_notes", "")
                 }
                 
-                print(f"🔍 Image Analysis Results (retry):")
-                print(f"  - Road Hazards: {road_hazards}")
-                print(f"  - Hazard Severity: {indicators['hazard_severity']}")
+                logger.debug(
+                    "🔍 Image analysis (retry): road hazards %s, severity %s",
+                    road_hazards, indicators["hazard_severity"]
+                )
                 
                 return {
                     "analysis": analysis_text,
@@ -453,7 +525,7 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
                     "hazard_description": analysis_data.get("hazard_description", "")
                 }
             except Exception as e2:
-                print(f"❌ Retry also failed: {str(e2)}")
+                logger.error("❌ Retry also failed: %s", e2)
                 return {
                     "error": f"Groq API error: {str(e2)}",
                     "safety_score": 50,
@@ -461,7 +533,7 @@ def analyze_image_safety(image_bytes: bytes) -> dict:
                 }
         
         # Even if there's an error, return structure that can be checked
-        print(f"❌ Final error return: {error_msg}")
+        logger.error("❌ Image analysis failed: %s", error_msg)
         return {
             "error": error_msg,
             "safety_score": 50,
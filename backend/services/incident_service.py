@@ -2,28 +2,308 @@
 User Incident Reporting Service
 Users can report crimes/incidents they witness or experience
 """
-import json
+import math
 import os
+import threading
+import time
 from datetime import datetime
-from typing import List, Dict
-from geopy.distance import geodesic
+from typing import List, Dict, Tuple
+import h3
+import numpy as np
+import orjson
 
-INCIDENTS_FILE = "incidents.json"
+try:
+    import numba
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+# One JSON object per line, so a report only appends a line instead of rewriting the file
+INCIDENTS_FILE = "incidents.jsonl"
+LEGACY_INCIDENTS_FILE = "incidents.json"  # Legacy single-array store, migrated once into INCIDENTS_FILE
+EARTH_RADIUS_KM = 6371.0088
+
+RECENT_WINDOW_SECONDS = 30 * 24 * 3600  # Incidents reported within 30 days count as recent
+
+# Parsed incidents.jsonl, reused until the file's mtime/size changes.
+# "revision" is bumped on every change to the cached list, including in-place appends.
+_incidents_cache = {"version": None, "data": [], "revision": 0}
+_incidents_lock = threading.Lock()
+
+# Column-wise (struct-of-arrays) view of the cached incident list: latitudes,
+# longitudes and report times. The buffers are over-allocated so a report appends
+# its row in place; they are only rebuilt when the list is reloaded or rewritten.
+_columns_cache = {"revision": None, "rows": 0, "buffers": None, "columns": None}
+_columns_lock = threading.Lock()
+
+# Spatial index: H3 cell (resolution 9, ~0.17-0.2km edge) -> row indices of the incidents inside it.
+# Built incrementally from the coordinate columns, so only new rows are indexed.
+H3_RESOLUTION = 9
+# Real cell edges vary with position on the icosahedron (about 0.17-0.2km at resolution 9) -
+# ring counts are sized from the query cell's own edges, shrunk by this margin to cover
+# slightly smaller cells elsewhere in the disk
+H3_EDGE_MARGIN = 0.9
+# Larger disks cost more than scanning the columns (the bounding box filter is vectorized),
+# so queries needing more rings (radius above ~7km) skip the index
+H3_MAX_RINGS = 30
+_cell_index: Dict[str, List[int]] = {}
+_indexed_rows = 0
+_index_lock = threading.Lock()
+
+def _haversine_numpy(lat_arr, lon_arr, qlat, qlon):
+    """Great-circle distance in km from (qlat, qlon) to each (lat_arr[i], lon_arr[i])"""
+    lat_rad = np.radians(lat_arr.astype(np.float64))
+    qlat_rad = math.radians(qlat)
+    dlat = lat_rad - qlat_rad
+    dlon = np.radians(lon_arr.astype(np.float64) - qlon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(qlat_rad) * np.cos(lat_rad) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+if _NUMBA_AVAILABLE:
+    # Compiled once and cached on disk, so only the first start pays the compile cost.
+    # Inputs are either the read-only cached columns or writable index-selected copies.
+    _signatures = [
+        numba.float64[::1](column, column, numba.float64, numba.float64)
+        for column in (numba.types.Array(numba.float32, 1, 'C', readonly=True), numba.float32[::1])
+    ]
+    
+    @numba.njit(_signatures, fastmath=True, cache=True, parallel=True)
+    def _haversine_km(lat_arr, lon_arr, qlat, qlon):
+        """Great-circle distance in km from (qlat, qlon) to each (lat_arr[i], lon_arr[i])"""
+        n = lat_arr.shape[0]
+        out = np.empty(n, dtype=np.float64)
+        qlat_rad = math.radians(qlat)
+        cos_qlat = math.cos(qlat_rad)
+        for i in numba.prange(n):
+            lat_rad = math.radians(np.float64(lat_arr[i]))
+            dlat = lat_rad - qlat_rad
+            dlon = math.radians(np.float64(lon_arr[i]) - qlon)
+            a = math.sin(dlat / 2) ** 2 + cos_qlat * math.cos(lat_rad) * math.sin(dlon / 2) ** 2
+            out[i] = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+        return out
+else:
+    # Without numba the same formula runs as whole-array NumPy ufuncs
+    _haversine_km = _haversine_numpy
+
+def _file_version(path: str):
+    """(mtime, size) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _migrate_legacy_incidents():
+    """One-shot migration from incidents.json to incidents.jsonl"""
+    try:
+        with open(LEGACY_INCIDENTS_FILE, 'rb') as f:
+            incidents = orjson.loads(f.read())
+    except:
+        return
+    save_incidents(incidents)
 
 def load_incidents() -> List[Dict]:
-    """Load incidents from file"""
-    if os.path.exists(INCIDENTS_FILE):
-        try:
-            with open(INCIDENTS_FILE, 'r') as f:
-                return json.load(f)
-        except:
+    """
+    Load incidents from file
+    
+    The parsed list is cached until the file changes on disk, and is shared
+    between callers - copy it before modifying. Reports made by this process
+    are appended to it in place.
+    """
+    version = _file_version(INCIDENTS_FILE)
+    if version is None:
+        if not os.path.exists(LEGACY_INCIDENTS_FILE):
             return []
-    return []
+        _migrate_legacy_incidents()
+        version = _file_version(INCIDENTS_FILE)
+    
+    with _incidents_lock:
+        if _incidents_cache["version"] == version:
+            return _incidents_cache["data"]
+    
+    incidents = []
+    try:
+        with open(INCIDENTS_FILE, 'rb') as f:
+            for line in f:
+                try:
+                    incidents.append(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    # Blank or partially written line (e.g. interrupted append) - skip it
+                    continue
+    except OSError:
+        return []
+    
+    with _incidents_lock:
+        _incidents_cache["version"] = version
+        _incidents_cache["data"] = incidents
+        _incidents_cache["revision"] += 1
+    return incidents
 
 def save_incidents(incidents: List[Dict]):
-    """Save incidents to file"""
-    with open(INCIDENTS_FILE, 'w') as f:
-        json.dump(incidents, f, indent=2)
+    """Rewrite the incidents file from a full list"""
+    tmp_file = INCIDENTS_FILE + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.writelines(orjson.dumps(incident) + b"\n" for incident in incidents)
+    os.replace(tmp_file, INCIDENTS_FILE)
+    
+    # What was just written is what the next load would parse
+    with _incidents_lock:
+        _incidents_cache["version"] = _file_version(INCIDENTS_FILE)
+        _incidents_cache["data"] = incidents
+        _incidents_cache["revision"] += 1
+
+def append_incident(incident: Dict):
+    """Append a single incident to the file without rewriting the existing ones"""
+    line = orjson.dumps(incident) + b"\n"
+    with _incidents_lock:
+        cache_current = _incidents_cache["version"] == _file_version(INCIDENTS_FILE)
+        with open(INCIDENTS_FILE, 'ab') as f:
+            f.write(line)
+        if cache_current:
+            _incidents_cache["data"].append(incident)
+            _incidents_cache["version"] = _file_version(INCIDENTS_FILE)
+            _incidents_cache["revision"] += 1
+            with _columns_lock:
+                if _columns_cache["revision"] == _incidents_cache["revision"] - 1:
+                    _append_column_row(incident)
+                    _columns_cache["revision"] = _incidents_cache["revision"]
+
+def _to_timestamp(incident: Dict) -> int:
+    """Epoch seconds an incident was reported at (0 if unknown)"""
+    reported_at_ts = incident.get("reported_at_ts")
+    if reported_at_ts is not None:
+        return reported_at_ts
+    
+    # Incidents saved before reported_at_ts existed only carry the ISO-8601 string
+    try:
+        return int(datetime.fromisoformat(incident.get("reported_at")).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+def _column_views(buffers: Tuple[np.ndarray, ...], rows: int) -> Tuple[np.ndarray, ...]:
+    """Read-only views of the first rows entries of each column buffer"""
+    columns = tuple(buffer[:rows] for buffer in buffers)
+    for column in columns:
+        # Shared between requests through _columns_cache
+        column.flags.writeable = False
+    return columns
+
+def _append_column_row(incident: Dict):
+    """Append an incident to the cached columns, doubling the buffers when full (caller holds _columns_lock)"""
+    rows = _columns_cache["rows"]
+    buffers = _columns_cache["buffers"]
+    if rows == len(buffers[0]):
+        # Views already handed out keep the old buffers
+        grown = tuple(np.empty(max(2 * rows, 1024), dtype=buffer.dtype) for buffer in buffers)
+        for old, new in zip(buffers, grown):
+            new[:rows] = old
+        buffers = grown
+    
+    lats, lons, reported_at = buffers
+    lats[rows] = incident["latitude"]
+    lons[rows] = incident["longitude"]
+    reported_at[rows] = _to_timestamp(incident)
+    
+    _columns_cache["rows"] = rows + 1
+    _columns_cache["buffers"] = buffers
+    _columns_cache["columns"] = _column_views(buffers, rows + 1)
+
+def load_columns(incidents: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Incident columns aligned with incidents, cached per revision of the incident list
+    
+    Row i of each column is incidents[i]. The list may grow after this returns,
+    so the columns can be shorter than it.
+    
+    Returns:
+        tuple: latitudes (float32), longitudes (float32), report times (int64 epoch seconds)
+    """
+    with _incidents_lock:
+        # A list load_incidents has since replaced is not cached
+        revision = _incidents_cache["revision"] if _incidents_cache["data"] is incidents else None
+        count = len(incidents)
+    with _columns_lock:
+        if revision is not None and _columns_cache["revision"] == revision:
+            return _columns_cache["columns"]
+    
+    # Rows past count were appended after the revision was read
+    incidents = incidents[:count]
+    # Built from the parsed incidents themselves, so the columns can never disagree
+    # with the file (an interrupted or interleaved report, or an edited line)
+    buffers = (
+        np.array([incident["latitude"] for incident in incidents], dtype=np.float32),
+        np.array([incident["longitude"] for incident in incidents], dtype=np.float32),
+        np.array([_to_timestamp(incident) for incident in incidents], dtype=np.int64),
+    )
+    columns = _column_views(buffers, count)
+    if revision is None:
+        return columns
+    
+    # Row numbers may now refer to different incidents
+    _reset_index()
+    
+    with _columns_lock:
+        _columns_cache["revision"] = revision
+        _columns_cache["rows"] = count
+        _columns_cache["buffers"] = buffers
+        _columns_cache["columns"] = columns
+    return columns
+
+def _reset_index():
+    """Forget the spatial index so it is rebuilt from the columns"""
+    global _indexed_rows
+    with _index_lock:
+        _cell_index.clear()
+        _indexed_rows = 0
+
+def _candidate_rows(lats: np.ndarray, lons: np.ndarray, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+    """
+    Row indices of incidents in H3 cells that can lie within radius_km of the location
+    (a superset of the actual matches, in file order)
+    """
+    global _indexed_rows
+    origin = h3.latlng_to_cell(latitude, longitude, H3_RESOLUTION)
+    edge_km = H3_EDGE_MARGIN * min(
+        h3.edge_length(edge, unit='km') for edge in h3.origin_to_directed_edges(origin)
+    )
+    # A point within radius_km lies in a cell whose centre is at most radius_km + 2 edges
+    # (one circumradius per cell) from the query cell's centre. Cells k rings out can be
+    # as close as 1.5*k edges (centre spacing sqrt(3) edges, times sqrt(3)/2 along a corner).
+    k = math.ceil((radius_km + 2 * edge_km) / (1.5 * edge_km))
+    if k > H3_MAX_RINGS or 3 * k * (k + 1) + 1 >= len(lats):
+        # More cells to probe than is worth it - scan every row
+        return np.arange(len(lats))
+    
+    with _index_lock:
+        if _indexed_rows > len(lats):
+            _cell_index.clear()
+            _indexed_rows = 0
+        for i in range(_indexed_rows, len(lats)):
+            cell = h3.latlng_to_cell(float(lats[i]), float(lons[i]), H3_RESOLUTION)
+            _cell_index.setdefault(cell, []).append(i)
+        _indexed_rows = len(lats)
+        
+        rows = []
+        for cell in h3.grid_disk(origin, k):
+            rows.extend(_cell_index.get(cell, ()))
+    
+    return np.sort(np.array(rows, dtype=np.intp))
+
+def _in_bounding_box(lats: np.ndarray, lons: np.ndarray, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+    """
+    Mask of the points inside a lat/lon box that contains the radius_km circle,
+    so the trig-heavy haversine only runs on points that can match
+    """
+    # 111 km per degree is a slight under-estimate, which keeps the box conservative.
+    # Longitude degrees shrink with latitude - size them at the circle's poleward edge.
+    dlat_deg = radius_km / 111.0
+    edge_lat = min(90.0, abs(latitude) + dlat_deg)
+    cos_edge = math.cos(math.radians(edge_lat))
+    dlon_deg = radius_km / (111.0 * cos_edge) if cos_edge > 1e-9 else 360.0
+    
+    # Longitude difference wrapped to [-180, 180) so the box works across the antimeridian
+    dlon = np.abs((lons - longitude + 180.0) % 360.0 - 180.0)
+    return (np.abs(lats - latitude) <= dlat_deg) & (dlon <= dlon_deg)
 
 def report_incident(latitude: float, longitude: float, incident_type: str, description: str = "") -> Dict:
     """
@@ -39,6 +319,7 @@ def report_incident(latitude: float, longitude: float, incident_type: str, descr
         dict: Confirmation of reported incident
     """
     incidents = load_incidents()
+    reported_at = time.time()
     
     new_incident = {
         "id": len(incidents) + 1,
@@ -46,12 +327,12 @@ def report_incident(latitude: float, longitude: float, incident_type: str, descr
         "longitude": longitude,
         "incident_type": incident_type,
         "description": description,
-        "reported_at": datetime.now().isoformat(),
+        "reported_at": datetime.fromtimestamp(reported_at).isoformat(),
+        "reported_at_ts": int(reported_at),
         "verified": False  # Could add verification system later
     }
     
-    incidents.append(new_incident)
-    save_incidents(incidents)
+    append_incident(new_incident)
     
     return {
         "success": True,
@@ -72,17 +353,29 @@ def get_incidents_near_location(latitude: float, longitude: float, radius_km: fl
         list: List of incidents within radius
     """
     incidents = load_incidents()
-    location = (latitude, longitude)
-    nearby_incidents = []
+    rows, distances = _nearby_rows(incidents, latitude, longitude, radius_km)
+    return _with_distances(incidents, rows, distances)
+
+def _nearby_rows(incidents: List[Dict], latitude: float, longitude: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Row indices (in file order) and distances of the incidents within radius_km"""
+    if not incidents:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
     
-    for incident in incidents:
-        incident_location = (incident["latitude"], incident["longitude"])
-        distance = geodesic(location, incident_location).kilometers
-        
-        if distance <= radius_km:
-            incident_copy = incident.copy()
-            incident_copy["distance_km"] = round(distance, 2)
-            nearby_incidents.append(incident_copy)
+    lats, lons, _ = load_columns(incidents)
+    rows = _candidate_rows(lats, lons, latitude, longitude, radius_km)
+    rows = rows[_in_bounding_box(lats[rows], lons[rows], latitude, longitude, radius_km)]
+    distances = _haversine_km(lats[rows], lons[rows], latitude, longitude)
+    
+    within = distances <= radius_km
+    return rows[within], distances[within]
+
+def _with_distances(incidents: List[Dict], rows: np.ndarray, distances: np.ndarray) -> List[Dict]:
+    """Copies of the selected incidents with their distance_km added"""
+    nearby_incidents = []
+    for i, distance in zip(rows, distances):
+        incident_copy = incidents[i].copy()
+        incident_copy["distance_km"] = round(float(distance), 2)
+        nearby_incidents.append(incident_copy)
     
     return nearby_incidents
 
@@ -98,20 +391,19 @@ def calculate_crime_score_from_incidents(latitude: float, longitude: float, radi
     Returns:
         dict: Crime statistics based on user reports
     """
-    incidents = get_incidents_near_location(latitude, longitude, radius_km)
+    all_incidents = load_incidents()
+    rows, distances = _nearby_rows(all_incidents, latitude, longitude, radius_km)
+    incidents = _with_distances(all_incidents, rows, distances)
     
     # Calculate crime rate based on number of incidents
     # More incidents = higher crime rate
     incident_count = len(incidents)
     
     # Recent incidents (within last 30 days) count more
-    from datetime import datetime, timedelta
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    
-    recent_count = sum(
-        1 for inc in incidents 
-        if datetime.fromisoformat(inc["reported_at"]) > thirty_days_ago
-    )
+    recent_count = 0
+    if incident_count:
+        _, _, reported_at = load_columns(all_incidents)
+        recent_count = int(np.count_nonzero(reported_at[rows] > time.time() - RECENT_WINDOW_SECONDS))
     
     if not incidents:
         # No incidents = very safe area
@@ -2,157 +2,324 @@
 Safety Score Calculator
 Combines image analysis, weather, and crime data to calculate safety score (1-100)
 """
-from typing import Dict
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
 
-def calculate_safety_score(
-    image_analysis: Dict,
-    weather_data: Dict,
-    crime_data: Dict
-) -> Dict:
+try:
+    import numba
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# The score starts at a neutral 50 and used to be blended in three steps:
+# image (score*0.6 + img*0.4), weather (score*0.75 + weather*0.25), crime (score*0.6 + crime*0.4).
+# Expanded, that is one weighted average with these effective weights:
+#   with image:    50*0.27 + img*0.18 + weather*0.15 + crime*0.40
+#   without image: 50*0.45 +            weather*0.15 + crime*0.40
+NEUTRAL_SCORE = 50
+WEATHER_WEIGHT = 0.25 * 0.6
+CRIME_WEIGHT = 0.4
+IMAGE_WEIGHT = 0.4 * 0.75 * 0.6
+BASE_WEIGHT_WITH_IMAGE = 0.6 * 0.75 * 0.6
+BASE_WEIGHT_WITHOUT_IMAGE = 0.75 * 0.6
+
+# Categorical inputs are passed to the scoring core as small integer codes.
+# Unknown values map to the code whose branch the old string comparisons fell into.
+SEVERITY_NONE, SEVERITY_LOW, SEVERITY_MODERATE, SEVERITY_HIGH, SEVERITY_CRITICAL, SEVERITY_UNKNOWN = range(6)
+SEVERITY_CODES = {
+    "none": SEVERITY_NONE,
+    "low": SEVERITY_LOW,
+    "moderate": SEVERITY_MODERATE,
+    "high": SEVERITY_HIGH,
+    "critical": SEVERITY_CRITICAL
+}
+LEVEL_GOOD, LEVEL_MODERATE, LEVEL_POOR = range(3)  # lighting and cleanliness
+LEVEL_CODES = {"good": LEVEL_GOOD, "moderate": LEVEL_MODERATE}
+WEATHER_NEUTRAL, WEATHER_NEGATIVE, WEATHER_POSITIVE = range(3)
+WEATHER_CODES = {"negative": WEATHER_NEGATIVE, "positive": WEATHER_POSITIVE}
+
+# Score adjustments indexed by the codes above
+# Note: hazard_severity already accounts for travel safety, so we don't double-penalize
+SEVERITY_PENALTY = (0, -12, -20, -30, -40, 0)  # none, low, moderate, high, critical, unknown
+HAZARD_PENALTY = -8  # Per detected hazard, only when no severity penalty applied
+TRAVEL_UNSAFE_PENALTY = -15  # Only when severity is none/low
+LIGHTING_DELTA = (10, 3, -3)  # good, moderate, poor
+CLEAN_DELTA = (5, 2, -2)  # good, moderate, poor
+PEOPLE_BONUS = 5  # People can indicate safety (witnesses) or danger (crowds)
+WEATHER_SCORE = (50, 30, 70)  # neutral, negative, positive
+
+# (highest score in the level, level, alert), in ascending order
+SAFETY_LEVELS = (
+    (19, "unsafe", True),
+    (39, "caution", True),
+    (59, "moderate", False),
+    (79, "safe", False),
+    (100, "very_safe", False)
+)
+
+# Categorical values come from a small vocabulary (or the vision model's spelling of it),
+# so the normalised lookups are memoised
+@lru_cache(maxsize=32)
+def _severity_code(value: str) -> int:
+    return SEVERITY_CODES.get(value.strip().lower(), SEVERITY_UNKNOWN)
+
+@lru_cache(maxsize=32)
+def _level_code(value: str) -> int:
+    return LEVEL_CODES.get(value.strip().lower(), LEVEL_POOR)
+
+@lru_cache(maxsize=32)
+def _weather_code(value: str) -> int:
+    return WEATHER_CODES.get(value.strip().lower(), WEATHER_NEUTRAL)
+
+def _code(lookup, value, default: int) -> int:
+    return lookup(value) if isinstance(value, str) else default
+
+def _score_core_py(has_image, severity_code, hazard_count, travel_safe, lighting_code,
+                   people_present, clean_code, weather_code, crime_rate):
     """
-    Calculate overall safety score from multiple factors
-    
-    Args:
-        image_analysis: Results from image analysis
-        weather_data: Weather information
-        crime_data: Crime statistics
+    Numeric part of calculate_safety_score
     
     Returns:
-        dict: Safety score (1-100) and breakdown
+        tuple: (image score or 0 without image, weather score, final score 1-100)
     """
-    score = 50  # Start with neutral score
-    factors = {}
-    
-    # Image analysis contribution (30% weight)
-    # Only calculate if image was actually analyzed (has real indicators, not empty)
-    has_image_analysis = (
-        "indicators" in image_analysis and 
-        image_analysis["indicators"] and 
-        isinstance(image_analysis["indicators"], dict) and
-        len(image_analysis["indicators"]) > 0 and
-        not image_analysis.get("error")
-    )
-    
-    if has_image_analysis:
+    if has_image:
         img_score = 50
-        indicators = image_analysis["indicators"]
         
         # ROAD HAZARDS - Most critical for travel safety (0-40 points impact)
-        road_hazards = indicators.get("road_hazards", {})
-        hazard_severity = indicators.get("hazard_severity", "none")
-        
-        # Check for specific hazards
-        has_construction = road_hazards.get("construction_roadwork", False)
-        has_water = road_hazards.get("water_flooding", False)
-        has_obstacles = road_hazards.get("obstacles_debris", False)
-        has_poor_road = road_hazards.get("poor_road_condition", False)
-        has_traffic_hazards = road_hazards.get("traffic_hazards", False)
-        
-        # Count number of hazards
-        hazard_count = sum([has_construction, has_water, has_obstacles, has_poor_road, has_traffic_hazards])
-        
-        # Apply severe penalties for road hazards
-        # Note: hazard_severity already accounts for travel safety, so we don't double-penalize
-        if hazard_severity == "critical":
-            img_score -= 40  # Critical hazards = very unsafe
-        elif hazard_severity == "high":
-            img_score -= 30  # High hazards = unsafe (construction sites)
-        elif hazard_severity == "moderate":
-            img_score -= 20  # Moderate hazards = caution (construction, water)
-        elif hazard_severity == "low":
-            img_score -= 12  # Low hazards = minor impact
-        elif hazard_count > 0:
+        severity_penalty = SEVERITY_PENALTY[severity_code]
+        if severity_penalty == 0:
             # If hazards detected but no severity, apply based on count
-            img_score -= (hazard_count * 8)  # Penalty per hazard
-        
-        # Travel safety check - only apply if severity wasn't already applied
-        # (hazard_severity already reflects travel safety)
-        # Only add extra penalty if travel_safe is False but severity is low/none
-        if not indicators.get("travel_safe", True) and hazard_severity in ["none", "low"]:
-            img_score -= 15  # Additional penalty only if severity didn't already account for it
+            severity_penalty = hazard_count * HAZARD_PENALTY
+        img_score += severity_penalty
         
-        # Lighting (0-10 points) - reduced impact
-        lighting = indicators.get("lighting", "moderate")
-        if lighting == "good":
-            img_score += 10
-        elif lighting == "moderate":
-            img_score += 3  # Small bonus for moderate lighting
-        else:
-            img_score -= 3  # Small penalty for poor lighting
+        if not travel_safe and severity_code <= SEVERITY_LOW:
+            img_score += TRAVEL_UNSAFE_PENALTY
         
-        # People present (0-5 points) - reduced impact
-        if indicators.get("people_present", False):
-            img_score += 5  # People can indicate safety (witnesses) or danger (crowds)
-        
-        # Cleanliness (0-5 points) - reduced impact
-        cleanliness = indicators.get("cleanliness", "moderate")
-        if cleanliness == "good":
-            img_score += 5
-        elif cleanliness == "moderate":
-            img_score += 2  # Small bonus
-        else:
-            img_score -= 2  # Small penalty
+        img_score += LIGHTING_DELTA[lighting_code] + CLEAN_DELTA[clean_code]
+        if people_present:
+            img_score += PEOPLE_BONUS
         
         # Ensure minimum score of 5 (not 0) to show that image was analyzed
-        # Even with severe hazards, we want to show some score
         img_score = max(5, min(100, img_score))
-        factors["image_analysis"] = img_score
-        # Increase weight of image analysis to 40% since it's a key feature
-        score = (score * 0.6) + (img_score * 0.4)
-        print(f"📊 Image score calculated: {img_score}, New total score after image: {score}")
+        score = NEUTRAL_SCORE * BASE_WEIGHT_WITH_IMAGE + img_score * IMAGE_WEIGHT
+    else:
+        img_score = 0
+        score = NEUTRAL_SCORE * BASE_WEIGHT_WITHOUT_IMAGE
+    
+    weather_score = WEATHER_SCORE[weather_code]
+    
+    # Invert crime rate: lower crime = higher score
+    score += weather_score * WEATHER_WEIGHT + (100 - crime_rate) * CRIME_WEIGHT
+    
+    # Rounding first drops float noise (e.g. 42.99999999999999)
+    # so exact whole-number results are not truncated one point low
+    final_score = max(1, min(100, int(round(score, 6))))
+    return img_score, weather_score, final_score
+
+if _NUMBA_AVAILABLE:
+    # Explicit signature: compiled when the module is imported (and cached on disk),
+    # so the first request does not pay the JIT cost
+    _score_core = numba.njit(
+        numba.types.UniTuple(numba.int64, 3)(
+            numba.boolean, numba.int64, numba.int64, numba.boolean, numba.int64,
+            numba.boolean, numba.int64, numba.int64, numba.float64
+        ),
+        cache=True,
+        boundscheck=False
+    )(_score_core_py)
+else:
+    _score_core = _score_core_py
+
+@dataclass(slots=True, frozen=True)
+class SafetyScore:
+    """Result of calculate_safety_score"""
+    safety_score: int  # 1-100
+    safety_level: str
+    alert: bool
+    image_analysis: Optional[int]  # None if no image
+    weather: int
+    crime_data: int
+    
+    @property
+    def breakdown(self) -> dict:
+        """Per-factor scores"""
+        return {
+            "image_analysis": self.image_analysis,
+            "weather": self.weather,
+            "crime_data": self.crime_data
+        }
+    
+    def to_dict(self) -> dict:
+        """JSON-ready form (the dict calculate_safety_score used to return)"""
+        breakdown = self.breakdown
+        return {
+            "safety_score": self.safety_score,
+            "safety_level": self.safety_level,
+            "alert": self.alert,
+            "factors": breakdown,
+            "breakdown": breakdown
+        }
+
+def _score_inputs(image_analysis: Dict, weather_data: Dict, crime_data: Dict) -> Tuple:
+    """Reduce the three result dicts to the numeric arguments of _score_core"""
+    # Image analysis contribution (18% effective weight)
+    # Only calculate if image was actually analyzed (has real indicators, not empty)
+    indicators = image_analysis.get("indicators")
+    # Indicators are always built by our own analysis code, so an exact type check suffices
+    has_image_analysis = (
+        type(indicators) is dict and
+        len(indicators) > 0 and
+        not image_analysis.get("error")
+    )
+    
+    if has_image_analysis:
+        ind_get = indicators.get
+        road_hazards = ind_get("road_hazards") or {}
+        hazard_get = road_hazards.get
+        
+        # Count number of hazards
+        hazard_count = sum((
+            hazard_get("construction_roadwork", False),
+            hazard_get("water_flooding", False),
+            hazard_get("obstacles_debris", False),
+            hazard_get("poor_road_condition", False),
+            hazard_get("traffic_hazards", False)
+        ))
+        severity_code = _code(_severity_code, ind_get("hazard_severity", "none"), SEVERITY_UNKNOWN)
+        travel_safe = bool(ind_get("travel_safe", True))
+        lighting_code = _code(_level_code, ind_get("lighting", "moderate"), LEVEL_POOR)
+        people_present = bool(ind_get("people_present", False))
+        clean_code = _code(_level_code, ind_get("cleanliness", "moderate"), LEVEL_POOR)
     else:
-        # No image provided - don't include in score calculation
-        factors["image_analysis"] = None
-    
-    # Weather contribution (25% weight)
-    weather_impact = weather_data.get("safety_impact", "neutral")
-    weather_score = 50
-    if weather_impact == "negative":
-        weather_score = 30
-    elif weather_impact == "positive":
-        weather_score = 70
-    
-    factors["weather"] = weather_score
-    score = (score * 0.75) + (weather_score * 0.25)
-    print(f"📊 Weather score: {weather_score}, New total score after weather: {score}")
-    
-    # Crime data contribution (50% weight - most important)
+        hazard_count = severity_code = lighting_code = clean_code = 0
+        travel_safe = True
+        people_present = False
+    
+    # Weather contribution (15% effective weight)
+    weather_code = _code(_weather_code, weather_data.get("safety_impact", "neutral"), WEATHER_NEUTRAL)
+    
+    # Crime data contribution (40% effective weight - most important)
     crime_rate = crime_data.get("crime_rate", 50)
-    crime_score = 100 - crime_rate  # Invert: lower crime = higher score
     
-    factors["crime_data"] = crime_score
-    score = (score * 0.6) + (crime_score * 0.4)
-    print(f"📊 Crime score: {crime_score}, New total score after crime: {score}")
+    return (
+        has_image_analysis, severity_code, int(hazard_count), travel_safe, lighting_code,
+        people_present, clean_code, weather_code, crime_rate
+    )
+
+def calculate_safety_score(
+    image_analysis: Dict,
+    weather_data: Dict,
+    crime_data: Dict
+) -> SafetyScore:
+    """
+    Calculate overall safety score from multiple factors
+    
+    Args:
+        image_analysis: Results from image analysis
+        weather_data: Weather information
+        crime_data: Crime statistics
+    
+    Returns:
+        SafetyScore: Safety score (1-100), level and breakdown
+    """
+    return _score_from_inputs(_score_inputs(image_analysis, weather_data, crime_data))
+
+# The score depends only on the handful of values _score_inputs extracts, which come from
+# small vocabularies - repeated checks of the same area reuse the (immutable) result
+@lru_cache(maxsize=512)
+def _score_from_inputs(inputs: Tuple) -> SafetyScore:
+    has_image_analysis, crime_rate = inputs[0], inputs[-1]
+    img_score, weather_score, final_score = _score_core(*inputs)
+    
+    image_score = img_score if has_image_analysis else None  # No image - not included in the score
+    crime_score = 100 - crime_rate
     
-    # Final score (1-100)
-    final_score = max(1, min(100, int(score)))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "📊 Safety score %d (image=%s, weather=%s, crime=%s)",
+            final_score, image_score, weather_score, crime_score
+        )
     
     # Determine safety level
-    if final_score >= 80:
-        level = "very_safe"
-        alert = False
-    elif final_score >= 60:
-        level = "safe"
-        alert = False
-    elif final_score >= 40:
-        level = "moderate"
-        alert = False
-    elif final_score >= 20:
-        level = "caution"
-        alert = True
-    else:
-        level = "unsafe"
-        alert = True
+    for threshold, level, alert in SAFETY_LEVELS:
+        if final_score <= threshold:
+            break
+    
+    return SafetyScore(final_score, level, alert, image_score, weather_score, crime_score)
+
+# Batch scoring - the same computation as _score_core over arrays of inputs
+BATCH_FIELDS = (
+    "has_image", "severity", "hazard_count", "travel_safe", "lighting",
+    "people_present", "cleanliness", "weather", "crime_rate"
+)
+_SEVERITY_PENALTY = np.array(SEVERITY_PENALTY, dtype=np.int16)
+_LIGHTING_DELTA = np.array(LIGHTING_DELTA, dtype=np.int16)
+_CLEAN_DELTA = np.array(CLEAN_DELTA, dtype=np.int16)
+_WEATHER_SCORE = np.array(WEATHER_SCORE, dtype=np.int16)
+
+def encode_safety_inputs(
+    image_analyses: Iterable[Dict],
+    weather_data: Iterable[Dict],
+    crime_data: Iterable[Dict]
+) -> Dict[str, np.ndarray]:
+    """
+    Encode per-point results into the column arrays used by calculate_safety_score_batch
+    
+    Args:
+        image_analyses: Image analysis result for each point
+        weather_data: Weather information for each point
+        crime_data: Crime statistics for each point
     
+    Returns:
+        dict: One array per BATCH_FIELDS entry
+    """
+    rows = [
+        _score_inputs(image_analysis, weather, crime)
+        for image_analysis, weather, crime in zip(image_analyses, weather_data, crime_data)
+    ]
+    dtypes = (np.bool_, np.int8, np.int16, np.bool_, np.int8, np.bool_, np.int8, np.int8, np.float64)
+    if not rows:
+        return {field: np.empty(0, dtype=dtype) for field, dtype in zip(BATCH_FIELDS, dtypes)}
     return {
-        "safety_score": final_score,
-        "safety_level": level,
-        "alert": alert,
-        "factors": factors,
-        "breakdown": {
-            "image_analysis": factors.get("image_analysis"),  # None if no image
-            "weather": factors.get("weather", 50),
-            "crime_data": factors.get("crime_data", 50)
-        }
+        field: np.array(column, dtype=dtype)
+        for field, column, dtype in zip(BATCH_FIELDS, zip(*rows), dtypes)
     }
 
+def calculate_safety_score_batch(batch: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Safety scores for many points at once (e.g. samples along a route)
+    
+    Args:
+        batch: Equal-length arrays keyed by BATCH_FIELDS (see encode_safety_inputs)
+    
+    Returns:
+        np.ndarray: Safety score (1-100) per point, int32
+    """
+    severity = np.asarray(batch["severity"], dtype=np.intp)
+    hazard_count = np.asarray(batch["hazard_count"], dtype=np.int16)
+    travel_safe = np.asarray(batch["travel_safe"], dtype=bool)
+    
+    # Severity penalty, or the per-hazard penalty where the severity gives none
+    penalty = np.take(_SEVERITY_PENALTY, severity)
+    img_score = 50 + np.where(penalty == 0, hazard_count * HAZARD_PENALTY, penalty)
+    img_score += np.where(~travel_safe & (severity <= SEVERITY_LOW), TRAVEL_UNSAFE_PENALTY, 0).astype(np.int16)
+    img_score += np.take(_LIGHTING_DELTA, np.asarray(batch["lighting"], dtype=np.intp))
+    img_score += np.take(_CLEAN_DELTA, np.asarray(batch["cleanliness"], dtype=np.intp))
+    img_score += np.where(np.asarray(batch["people_present"], dtype=bool), PEOPLE_BONUS, 0).astype(np.int16)
+    np.clip(img_score, 5, 100, out=img_score)
+    
+    score = np.where(
+        np.asarray(batch["has_image"], dtype=bool),
+        NEUTRAL_SCORE * BASE_WEIGHT_WITH_IMAGE + img_score * IMAGE_WEIGHT,
+        NEUTRAL_SCORE * BASE_WEIGHT_WITHOUT_IMAGE
+    )
+    weather_score = np.take(_WEATHER_SCORE, np.asarray(batch["weather"], dtype=np.intp))
+    crime_score = 100 - np.asarray(batch["crime_rate"], dtype=np.float64)
+    score += weather_score * WEATHER_WEIGHT + crime_score * CRIME_WEIGHT
+    
+    return np.clip(np.round(score, 6).astype(np.int32), 1, 100)
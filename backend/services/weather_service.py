@@ -2,94 +2,311 @@
 Weather Service - Get weather data for safety analysis
 Uses OpenWeatherMap API (free tier available)
 """
+import asyncio
 import os
-import requests
-from typing import Optional
+import threading
+from types import MappingProxyType
+import httpx
+import orjson
+import urllib3
+from typing import List, Optional, Sequence, Tuple
+from cachetools import LRUCache, TTLCache
+from urllib3.util.retry import Retry
+
+WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+# Connection pool for the sync path - plain urllib3, without the requests Session layer.
+# Keeps the TCP/TLS connection to the API alive between calls and retries transient gateway errors
+WEATHER_SYNC_TIMEOUT = urllib3.Timeout(connect=1.0, read=4.0)
+_pool = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=16,
+    retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+)
+
+# Shared async client - HTTP/2 lets concurrent lookups multiplex over one connection.
+# Created on first use so it binds to the running event loop.
+WEATHER_TIMEOUT = httpx.Timeout(connect=1.0, read=4.0, write=1.0, pool=1.0)
+WEATHER_LIMITS = httpx.Limits(max_keepalive_connections=32)
+_async_client: Optional[httpx.AsyncClient] = None
+# Upstream calls in flight at once per batch. This caps concurrency only, not calls per
+# minute - fast responses free a slot straight away
+WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", 8))
+
+# Live API results keyed by coordinates rounded to 2 decimals (~1km) - weather barely
+# changes over that distance or within the TTL
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", 300))  # seconds
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", 1024))
+_weather_cache = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_CACHE_TTL)
+_weather_cache_lock = threading.Lock()
+# HTTP validators (ETag, Last-Modified, parsed result) of the last live response per key.
+# Outlive the TTL so an expired entry can be revalidated with a conditional GET -
+# a 304 Not Modified reuses the stored result without a body to download or parse.
+_weather_validators = LRUCache(maxsize=WEATHER_CACHE_SIZE)
+
+# OpenWeatherMap main conditions (lowercased) that make travel less safe
+NEGATIVE_CONDITIONS = frozenset({"rain", "storm", "snow", "fog", "thunderstorm", "drizzle", "mist", "tornado"})
+
+# Neutral weather used when the API key is missing or the API fails (read-only)
+DEFAULT_WEATHER = MappingProxyType({
+    "temperature": 20,
+    "condition": "clear",
+    "visibility": 10,
+    "wind_speed": 5,
+    "safety_impact": "neutral"
+})
+
+def _default_weather() -> dict:
+    """Mutable copy of DEFAULT_WEATHER - callers and the JSON encoder expect a plain dict"""
+    return dict(DEFAULT_WEATHER)
+
+def _fallback_weather(error: str) -> dict:
+    """Default weather tagged with the error that prevented a live lookup"""
+    return {**DEFAULT_WEATHER, "error": error, "data_source": "fallback"}
+
+def _cache_key(latitude: float, longitude: float) -> tuple:
+    return (round(latitude, 2), round(longitude, 2))
+
+def _get_cached(key: tuple) -> Optional[dict]:
+    with _weather_cache_lock:
+        cached = _weather_cache.get(key)
+    return dict(cached) if cached is not None else None
+
+def _store(key: tuple, result: dict) -> dict:
+    # Only live data is cached - fallback responses are retried on the next call
+    with _weather_cache_lock:
+        _weather_cache[key] = result
+    return dict(result)
+
+def _conditional_headers(key: tuple) -> dict:
+    """If-None-Match / If-Modified-Since headers for a previously seen response"""
+    with _weather_cache_lock:
+        validators = _weather_validators.get(key)
+    if validators is None:
+        return {}
+    etag, last_modified, _ = validators
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+def _has_stored_result(key: tuple) -> bool:
+    """Whether a 304 for this key has a stored result to reuse"""
+    with _weather_cache_lock:
+        return key in _weather_validators
+
+def _parse_response(key: tuple, status: int, content: bytes, headers) -> dict:
+    """Weather from an API response (urllib3 or httpx), reusing the stored result on 304"""
+    if status == 304:
+        with _weather_cache_lock:
+            validators = _weather_validators.get(key)
+        if validators is None:
+            # Validators evicted since the request was sent, or a 304 nobody asked for
+            raise ValueError("Weather API returned 304 without a cached result")
+        return validators[2]
+    if status >= 400:
+        # Error bodies (bad key, rate limit) must not be parsed and cached as weather
+        raise ValueError(f"Weather API error: HTTP {status}")
+    result = _parse_weather(orjson.loads(content))
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if etag or last_modified:
+        with _weather_cache_lock:
+            _weather_validators[key] = (etag, last_modified, result)
+    return result
+
+def _request_params(latitude: float, longitude: float, api_key: str) -> dict:
+    return {
+        "lat": latitude,
+        "lon": longitude,
+        "appid": api_key,
+        "units": "metric"
+    }
+
+def _parse_weather(data: dict) -> dict:
+    """Extract safety-relevant information from an OpenWeatherMap response"""
+    # Each nested object is looked up once; everything else in the payload is ignored
+    current = (data.get("weather") or [{}])[0]
+    main = data.get("main") or {}
+    weather_condition = current.get("main", "clear").lower()
+    visibility = data.get("visibility", 10000) / 1000  # Convert to km
+    wind_speed = (data.get("wind") or {}).get("speed", 0)
+
+    # Determine safety impact
+    if weather_condition in NEGATIVE_CONDITIONS or visibility < 1 or wind_speed > 15:
+        safety_impact = "negative"
+    else:
+        safety_impact = "neutral"
+
+    return {
+        "temperature": round(main.get("temp", 20), 1),
+        "condition": weather_condition,
+        "visibility": round(visibility, 1),
+        "wind_speed": round(wind_speed, 1),
+        "safety_impact": safety_impact,
+        "description": current.get("description", ""),
+        "humidity": main.get("humidity", 0),
+        "city": data.get("name", ""),
+        "country": (data.get("sys") or {}).get("country", ""),
+        "data_source": "openweathermap_api"
+    }
 
 def get_weather_data(latitude: float, longitude: float) -> dict:
     """
     Get weather data for a location
-    
+
     Args:
         latitude: Location latitude
         longitude: Location longitude
-    
+
     Returns:
         dict: Weather data with safety-relevant information
     """
     api_key = os.getenv("WEATHER_API_KEY")
-    
+
     if not api_key:
         # Return mock data if API key not available
-        return {
-            "temperature": 20,
-            "condition": "clear",
-            "visibility": 10,
-            "wind_speed": 5,
-            "safety_impact": "neutral"
-        }
-    
+        return _default_weather()
+
+    key = _cache_key(latitude, longitude)
+    cached = _get_cached(key)
+    if cached is not None:
+        return cached
+
     try:
-        url = f"http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "lat": latitude,
-            "lon": longitude,
-            "appid": api_key,
-            "units": "metric"
-        }
-        
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract relevant safety information
-        weather_condition = data.get("weather", [{}])[0].get("main", "clear").lower()
-        visibility = data.get("visibility", 10000) / 1000  # Convert to km
-        wind_speed = data.get("wind", {}).get("speed", 0)
-        temperature = data.get("main", {}).get("temp", 20)
-        
-        # Determine safety impact
-        safety_impact = "neutral"
-        if weather_condition in ["rain", "storm", "snow", "fog"]:
-            safety_impact = "negative"
-        elif visibility < 1:
-            safety_impact = "negative"
-        elif wind_speed > 15:
-            safety_impact = "negative"
-        
-        return {
-            "temperature": round(temperature, 1),
-            "condition": weather_condition,
-            "visibility": round(visibility, 1),
-            "wind_speed": round(wind_speed, 1),
-            "safety_impact": safety_impact,
-            "description": data.get("weather", [{}])[0].get("description", ""),
-            "humidity": data.get("main", {}).get("humidity", 0),
-            "city": data.get("name", ""),
-            "country": data.get("sys", {}).get("country", ""),
-            "data_source": "openweathermap_api"
-        }
-        
-    except requests.exceptions.RequestException as e:
+        # Separate connect/read timeouts
+        response = _pool.request(
+            "GET",
+            WEATHER_API_URL,
+            fields=_request_params(latitude, longitude, api_key),
+            headers=_conditional_headers(key),
+            timeout=WEATHER_SYNC_TIMEOUT
+        )
+        if response.status == 304 and not _has_stored_result(key):
+            # Nothing to reuse - fetch the full body once, unconditionally
+            response = _pool.request(
+                "GET",
+                WEATHER_API_URL,
+                fields=_request_params(latitude, longitude, api_key),
+                timeout=WEATHER_SYNC_TIMEOUT
+            )
+        result = _parse_response(key, response.status, response.data, response.headers)
+    except urllib3.exceptions.HTTPError as e:
+        # Network/API error
+        return _fallback_weather(f"Weather API error: {str(e)}")
+    except Exception as e:
+        # Other errors
+        return _fallback_weather(str(e))
+
+    return _store(key, result)
+
+def get_weather_client() -> httpx.AsyncClient:
+    """Shared async HTTP client for the weather API, created on first use"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(http2=True, timeout=WEATHER_TIMEOUT, limits=WEATHER_LIMITS)
+    return _async_client
+
+async def close_weather_client():
+    """Close the shared async client (on application shutdown)"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+async def get_weather_data_async(latitude: float, longitude: float, client: Optional[httpx.AsyncClient] = None) -> dict:
+    """
+    Non-blocking get_weather_data
+
+    Args:
+        latitude: Location latitude
+        longitude: Location longitude
+        client: HTTP client to use instead of the shared one
+
+    Returns:
+        dict: Weather data with safety-relevant information
+    """
+    api_key = os.getenv("WEATHER_API_KEY")
+
+    if not api_key:
+        # Return mock data if API key not available
+        return _default_weather()
+
+    key = _cache_key(latitude, longitude)
+    cached = _get_cached(key)
+    if cached is not None:
+        return cached
+
+    try:
+        client = client or get_weather_client()
+        response = await client.get(
+            WEATHER_API_URL,
+            params=_request_params(latitude, longitude, api_key),
+            headers=_conditional_headers(key)
+        )
+        if response.status_code == 304 and not _has_stored_result(key):
+            # Nothing to reuse - fetch the full body once, unconditionally
+            response = await client.get(WEATHER_API_URL, params=_request_params(latitude, longitude, api_key))
+        result = _parse_response(key, response.status_code, response.content, response.headers)
+    except httpx.HTTPError as e:
         # Network/API error
-        return {
-            "temperature": 20,
-            "condition": "clear",
-            "visibility": 10,
-            "wind_speed": 5,
-            "safety_impact": "neutral",
-            "error": f"Weather API error: {str(e)}",
-            "data_source": "fallback"
-        }
+        return _fallback_weather(f"Weather API error: {str(e)}")
     except Exception as e:
         # Other errors
-        return {
-            "temperature": 20,
-            "condition": "clear",
-            "visibility": 10,
-            "wind_speed": 5,
-            "safety_impact": "neutral",
-            "error": str(e),
-            "data_source": "fallback"
-        }
+        return _fallback_weather(str(e))
+
+    return _store(key, result)
+
+async def get_weather_data_batch(
+    coords: Sequence[Tuple[float, float]],
+    max_concurrency: int = WEATHER_BATCH_CONCURRENCY,
+    client: Optional[httpx.AsyncClient] = None
+) -> List[dict]:
+    """
+    Weather for many points at once (e.g. samples along a route)
+    
+    Args:
+        coords: (latitude, longitude) pairs
+        max_concurrency: Maximum upstream requests in flight
+        client: HTTP client to use instead of the shared one
+    
+    Returns:
+        list: Weather dict for each point, in input order
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def fetch(latitude: float, longitude: float) -> dict:
+        async with semaphore:
+            return await get_weather_data_async(latitude, longitude, client)
+    
+    # Points in the same cache cell share a single lookup
+    unique = {}
+    for latitude, longitude in coords:
+        unique.setdefault(_cache_key(latitude, longitude), (latitude, longitude))
+    
+    results = await asyncio.gather(
+        *(fetch(latitude, longitude) for latitude, longitude in unique.values()),
+        return_exceptions=True
+    )
+    by_key = {
+        key: result if isinstance(result, dict) else _fallback_weather(str(result))
+        for key, result in zip(unique, results)
+    }
+    return [dict(by_key[_cache_key(latitude, longitude)]) for latitude, longitude in coords]
 
+def get_weather_data_batch_sync(
+    coords: Sequence[Tuple[float, float]],
+    max_concurrency: int = WEATHER_BATCH_CONCURRENCY
+) -> List[dict]:
+    """
+    Blocking get_weather_data_batch for code that has no event loop
+    (must not be called from inside a running loop)
+    """
+    async def run() -> List[dict]:
+        # Own client - the shared one is bound to the application's event loop
+        async with httpx.AsyncClient(http2=True, timeout=WEATHER_TIMEOUT, limits=WEATHER_LIMITS) as client:
+            return await get_weather_data_batch(coords, max_concurrency, client)
+    
+    return asyncio.run(run())